@@ -0,0 +1,10 @@
+# config.py
+from typing import Dict, Final, List
+
+HOST: Final[str] = "localhost"
+PORTS: Final[List[int]] = [5000, 5001, 5002]
+PROC_NAMES: Final[Dict[int, str]] = {5000: "processo1", 5001: "processo2", 5002: "processo3"}
+# Índice de cada processo, na ordem das portas; usado para compor o msg_id numérico
+PROC_INDEX: Final[Dict[str, int]] = {name: i for i, (_, name) in enumerate(sorted(PROC_NAMES.items()))}
+# O msg_id reserva 2 bits para o índice do processo
+assert len(PROC_INDEX) <= 4, "msg_id suporta no máximo 4 processos"
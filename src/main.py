@@ -6,28 +6,25 @@
 ################
 
 # main.py
-import socket
 import sys
-from process import Process
-
-HOST = "localhost"
-PORTS = [5000, 5001, 5002]
-PROC_NAMES = {5000: "processo1", 5001: "processo2", 5002: "processo3"}
+try:
+    import readline  # noqa: F401 - habilita histórico e edição de linha no input()
+except ImportError:
+    pass
+from config import PORTS, PROC_NAMES
+from process import Process, create_listener
 
 def pick_free_port(candidates):
+    """Abrir o socket de escuta na primeira porta livre; retorna (socket, porta)."""
     for p in candidates:
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
-            s.bind((HOST, p))
-            s.close()
-            return p
+            return create_listener(p), p
         except OSError:
-            s.close()
             continue
-    return None
+    return None, None
 
 def main():
-    chosen = pick_free_port(PORTS)
+    listener, chosen = pick_free_port(PORTS)
     if chosen is None:
         print("Nenhuma porta disponível entre:", PORTS)
         sys.exit(1)
@@ -45,7 +42,7 @@ def main():
     other_ports = [p for p in PORTS if p != chosen]
     
     proc = Process(proc_id, chosen, other_ports, clock_increment)
-    proc.start()
+    proc.start(listener)
     
     try:
         print(f"Iniciando processo {proc_id}, porta {chosen} com incremento de clock {clock_increment}.")
@@ -57,30 +54,35 @@ def main():
         print("  pass           - Incrementa o relógio em um ciclo")
         print("  quit           - Para o processo")
         
+        def send(message_content):
+            if message_content:
+                proc.send_message(message_content)
+            else:
+                print("Falta o conteúdo da mensagem.")
+        
+        # Cada comando recebe o restante da linha como argumento
+        commands = {
+            "deliver": lambda rest: proc.try_deliver_message(),
+            "queue": lambda rest: proc.show_queue(),
+            "clock": lambda rest: print(f"Clock atual: {proc.get_clock()}"),
+            "pass": lambda rest: proc.increment_clock(),
+            "send": send,
+        }
+        
         while True:
             try:
-                user_input = input(f"[{proc_id}]> ").strip()
-                if not user_input:
+                cmd, _, rest = input(f"[{proc_id}]> ").strip().partition(" ")
+                if not cmd:
                     continue
+                cmd = cmd.lower()
                     
-                if user_input.lower() == "quit":
+                if cmd == "quit":
                     break
-                elif user_input.lower() == "deliver":
-                    proc.try_deliver_message()
-                elif user_input.lower() == "queue":
-                    proc.show_queue()
-                elif user_input.lower() == "clock":
-                    print(f"Clock atual: {proc.get_clock()}")
-                elif user_input.lower() == "pass":
-                    proc.increment_clock()
-                elif user_input.startswith("send "):
-                    message_content = user_input[5:].strip()
-                    if message_content:
-                        proc.send_message(message_content)
-                    else:
-                        print("Falta o conteúdo da mensagem.")
-                else:
+                handler = commands.get(cmd)
+                if handler is None:
                     print("Comando inválido.")
+                else:
+                    handler(rest.strip())
                     
             except KeyboardInterrupt:
                 break
@@ -1,47 +1,95 @@
 # message.py
+import struct
 from enum import Enum
-from typing import Optional
+from typing import List, Optional
+
+from config import PROC_INDEX
 
 class MessageType(Enum):
     MULTICAST = "multicast"
-    ACK = "ack"
+    ACK_BATCH = "ack_batch"
+
+# Wire code <-> member lookup, avoids Enum.__call__ on every decoded message
+_TYPE_CACHE = tuple(MessageType)
+_TYPE_CODE = {e: i for i, e in enumerate(_TYPE_CACHE)}
+
+# Fixed frame header: type, timestamp, sender length, content length, number of acked ids.
+# Followed by the sender, the content and each acked id as an unsigned 64-bit int.
+_HEADER = struct.Struct('!BQBIH')
+_MSG_ID = struct.Struct('!Q')
+_NO_CONTENT = 0xFFFFFFFF
+
+# msg_id packs the sender index in the top 2 bits and the timestamp in the low 62 bits
+_SENDER_SHIFT = 62
+_TIMESTAMP_MASK = (1 << _SENDER_SHIFT) - 1
+_PROC_BY_INDEX = {i: name for name, i in PROC_INDEX.items()}
+
+
+def format_msg_id(msg_id: int) -> str:
+    """Human-readable form of a numeric msg_id, e.g. 'processo1_42'."""
+    return f"{_PROC_BY_INDEX[msg_id >> _SENDER_SHIFT]}_{msg_id & _TIMESTAMP_MASK}"
 
 class Message:
     """Message class for totally ordered multicast."""
     
+    __slots__ = ('msg_id', 'msg_type', 'sender', 'timestamp', 'content',
+                 'original_msg_ids', '_bytes')
+    
     def __init__(self, msg_type: MessageType, sender: str, timestamp: int, 
-                 content: Optional[str] = None, original_msg_id: Optional[str] = None):
-        self.msg_id = f"{sender}_{timestamp}"
+                 content: Optional[str] = None, original_msg_ids: Optional[List[int]] = None):
         self.msg_type = msg_type
         self.sender = sender
         self.timestamp = timestamp
         self.content = content
-        self.original_msg_id = original_msg_id  # For ACK messages
+        self.original_msg_ids = original_msg_ids  # For ACK_BATCH messages
+        # Unique message id, derived from sender index and timestamp
+        self.msg_id = (PROC_INDEX[sender] << _SENDER_SHIFT) | timestamp
+        self._bytes = None
     
-    def to_dict(self):
-        """Convert message to dictionary for JSON serialization."""
-        return {
-            'msg_id': self.msg_id,
-            'msg_type': self.msg_type.value,
-            'sender': self.sender,
-            'timestamp': self.timestamp,
-            'content': self.content,
-            'original_msg_id': self.original_msg_id
-        }
+    def to_bytes(self) -> bytes:
+        """Serialize to the binary frame layout; computed once and reused for every send."""
+        if self._bytes is None:
+            if not 0 <= self.timestamp <= _TIMESTAMP_MASK:
+                raise ValueError(f"timestamp {self.timestamp} does not fit in the 62-bit msg_id")
+            sender = self.sender.encode()
+            content = self.content.encode() if self.content is not None else b''
+            ids = self.original_msg_ids if self.msg_type == MessageType.ACK_BATCH else []
+            parts = [
+                _HEADER.pack(_TYPE_CODE[self.msg_type], self.timestamp, len(sender),
+                             len(content) if self.content is not None else _NO_CONTENT, len(ids)),
+                sender,
+                content,
+            ]
+            for msg_id in ids:
+                parts.append(_MSG_ID.pack(msg_id))
+            self._bytes = b''.join(parts)
+        return self._bytes
     
     @classmethod
-    def from_dict(cls, data: dict):
-        """Create message from dictionary."""
-        message = cls(
-            msg_type=MessageType(data['msg_type']),
-            sender=data['sender'],
-            timestamp=data['timestamp'],
-            content=data.get('content'),
-            original_msg_id=data.get('original_msg_id')
+    def from_bytes(cls, data):
+        """Create message from a binary frame (bytes, bytearray or memoryview)."""
+        data = memoryview(data)
+        type_code, timestamp, sender_len, content_len, id_count = _HEADER.unpack_from(data, 0)
+        offset = _HEADER.size
+        sender = str(data[offset:offset + sender_len], 'utf-8')
+        offset += sender_len
+        content = None
+        if content_len != _NO_CONTENT:
+            content = str(data[offset:offset + content_len], 'utf-8')
+            offset += content_len
+        ids = []
+        for _ in range(id_count):
+            ids.append(_MSG_ID.unpack_from(data, offset)[0])
+            offset += _MSG_ID.size
+        
+        msg_type = _TYPE_CACHE[type_code]
+        return cls(
+            msg_type=msg_type,
+            sender=sender,
+            timestamp=timestamp,
+            content=content,
+            original_msg_ids=ids if msg_type == MessageType.ACK_BATCH else None
         )
-        # Mantém o msg_id original do dicionário
-        message.msg_id = data['msg_id']
-        return message
     
     def __repr__(self):
-        return f"Message(id={self.msg_id}, type={self.msg_type.value}, sender={self.sender}, ts={self.timestamp}, content='{self.content}')"
\ No newline at end of file
+        return f"Message(id={format_msg_id(self.msg_id)}, type={self.msg_type.value}, sender={self.sender}, ts={self.timestamp}, content='{self.content}')"
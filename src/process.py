@@ -1,11 +1,67 @@
 # process.py
+import bisect
+import concurrent.futures
+import heapq
+import io
 import socket
 import threading
-import json
+from collections import deque
+import queue
+import selectors
 import time
-from message import Message, MessageType
+import struct
+import sys
+from config import HOST, PROC_INDEX, PROC_NAMES
+from message import Message, MessageType, format_msg_id
 
-HOST = "localhost"
+# Cada mensagem no fio é precedida pelo seu tamanho (4 bytes, big-endian)
+FRAME_HEADER = struct.Struct("!I")
+# Tamanho inicial do buffer de leitura de cada conexão (cresce se chegar um quadro maior)
+RECV_BUFFER_SIZE = 65536
+# Máximo de mensagens agrupadas em um único envio por par
+SEND_BATCH_SIZE = 100
+# Confirmações são agrupadas até atingir este tamanho ou após este tempo sem novas
+ACK_BATCH_SIZE = 25
+ACK_FLUSH_DELAY = 150e-6  # segundos
+
+def create_listener(port):
+    """Criar o socket de escuta do servidor em HOST:port.
+    
+    SO_REUSEADDR permite reabrir a porta logo após um reinício, mesmo com
+    conexões antigas em TIME_WAIT. Levanta OSError se a porta estiver em uso.
+    """
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind((HOST, port))
+        s.listen(5)
+    except OSError:
+        s.close()
+        raise
+    return s
+
+class _RecvBuffer:
+    """Buffer de leitura pré-alocado de uma conexão; `fill` bytes estão ocupados."""
+    
+    __slots__ = ('buf', 'view', 'fill')
+    
+    def __init__(self, size=RECV_BUFFER_SIZE):
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.fill = 0
+    
+    def compact(self, offset, needed):
+        """Descartar os `offset` bytes já consumidos e garantir espaço para `needed` bytes."""
+        remaining = self.fill - offset
+        if needed > len(self.buf):
+            buf = bytearray(max(needed, 2 * len(self.buf)))
+            buf[:remaining] = self.view[offset:self.fill]
+            self.view.release()
+            self.buf = buf
+            self.view = memoryview(buf)
+        elif offset:
+            self.view[:remaining] = self.view[offset:self.fill]
+        self.fill = remaining
 
 class Process:
     """Processo com relógio lógico e capacidades de multicast totalmente ordenado."""
@@ -16,174 +72,333 @@ class Process:
         self.other_ports = other_ports
         self.clock_increment = clock_increment
         
+        # Um único lock reentrante protege relógio, fila, acks e acks pendentes;
+        # cada operação pública faz uma só seção crítica
+        self._state_lock = threading.RLock()
+        
         # Relógio lógico de Lamport
         self.logical_clock = 0
-        self.clock_lock = threading.Lock()
         
-        # Fila de mensagens ordenadas por timestamp
-        self.message_queue = []
-        self.queue_lock = threading.Lock()
+        # Fila de mensagens: uma deque por remetente com entradas (timestamp, remetente, msg_id, mensagem).
+        # Cada remetente envia em ordem crescente de timestamp pelo mesmo canal FIFO, então cada
+        # deque já fica ordenada; o INÍCIO da fila é o menor entre os inícios das deques
+        # (comparação de tuplas dá a ordem total de Lamport)
+        self.message_queue = {}  # {remetente: deque}
+        self._queue_size = 0
+        
+        # Área de espera entre a thread de rede (produtora) e quem entrega/exibe a fila
+        # (consumidora). deque.append/popleft são atômicos no CPython, então a produtora
+        # não precisa de lock; a consumidora move as mensagens para message_queue sob _state_lock
+        self._incoming = deque()
         
         # Rastreamento de confirmações (acks)
-        # Mantém registro de quais processos confirmaram cada mensagem
-        self.acknowledgments = {}
-        self.ack_lock = threading.Lock()
+        # Mantém, para cada mensagem, uma máscara de bits dos processos que a confirmaram
+        self.acknowledgments = {}  # {message_id: máscara}
         
         # Socket do servidor
         self._server_socket = None
-        self._running = threading.Event()
+        self._running = False  # lido sem lock: atribuição de bool é atômica sob o GIL
+        # Par de sockets usado por stop() para acordar o seletor do servidor
+        self._wake_r, self._wake_w = socket.socketpair()
+        
+        # Conexões persistentes com cada processo, abertas sob demanda pela thread de envio
+        self._peer_conns = {}  # {porta: socket}
+        self._send_queue = queue.Queue()
+        
+        # Pool que processa as mensagens recebidas fora da thread do seletor
+        self._pool = None
+        
+        # Confirmações aguardando envio agregado em uma única mensagem ACK_BATCH
+        self._pending_ack_batch = []  # [msg_id]
+        self._ack_cond = threading.Condition()
         
         # Todos os processos no grupo 
         self.all_ports = sorted([port] + other_ports) 
-        port_to_process = {5000: "processo1", 5001: "processo2", 5002: "processo3"}
-        self.all_processes = set([port_to_process[p] for p in self.all_ports])
+        self._remote_ports = tuple(p for p in self.all_ports if p != self.port)
+        self.all_processes = frozenset(PROC_NAMES[p] for p in self.all_ports)
         self.required_acks = len(self.all_processes)  # Precisa de confirmações de todos os processos
+        # Bit de cada processo na máscara de confirmações, pelo mesmo índice usado no msg_id
+        self._proc_bit = {name: 1 << PROC_INDEX[name] for name in sorted(self.all_processes, key=PROC_INDEX.get)}
+        self._full_mask = sum(self._proc_bit.values())
         
-        print(f"[{self.proc_id}] Todos os processos no grupo: {sorted(list(self.all_processes))}")
+        print(f"[{self.proc_id}] Todos os processos no grupo: {sorted(self.all_processes)}")
         print(f"[{self.proc_id}] Confirmações necessárias: {self.required_acks}")
         
         # Se o ack chega antes da mensagem, armazenamos o ack pendente até que a mensagem original chegue
         self.pending_acks = {}  # {message_id: lista de mensagens de confirmação}
-        self.pending_lock = threading.Lock()
     
     def increment_clock(self):
         """Antes de executar um evento, incrementar Ci."""
-        with self.clock_lock:
-            old_clock = self.logical_clock
-            self.logical_clock += self.clock_increment
-            print(f"[{self.proc_id}] Relógio incrementado: {old_clock} → {self.logical_clock}")
-            return self.logical_clock
+        out = io.StringIO()
+        with self._state_lock:
+            clock = self._increment_clock_locked(out)
+        sys.stdout.write(out.getvalue())
+        return clock
+    
+    def _increment_clock_locked(self, out):
+        """increment_clock para quem já segura _state_lock; o log vai para `out`."""
+        old_clock = self.logical_clock
+        self.logical_clock += self.clock_increment
+        out.write(f"[{self.proc_id}] Relógio incrementado: {old_clock} → {self.logical_clock}\n")
+        return self.logical_clock
     
     def update_clock_on_receive(self, received_timestamp):
         """ Ao receber a mensagem m, ajustar Cj = max{Cj, ts(m)}. + 1"""
-        with self.clock_lock:
-            old_clock = self.logical_clock
-            self.logical_clock = max(self.logical_clock, received_timestamp) + 1
-            if self.logical_clock != old_clock:
-                print(f"[{self.proc_id}] Relógio ajustado no recebimento: {old_clock} → {self.logical_clock} (timestamp recebido: {received_timestamp})")
-            else:
-                print(f"[{self.proc_id}] Relógio inalterado no recebimento: {self.logical_clock} (timestamp recebido: {received_timestamp})")
+        out = io.StringIO()
+        with self._state_lock:
+            self._update_clock_on_receive_locked(received_timestamp, out)
+        sys.stdout.write(out.getvalue())
+    
+    def _update_clock_on_receive_locked(self, received_timestamp, out):
+        """update_clock_on_receive para quem já segura _state_lock; o log vai para `out`."""
+        old_clock = self.logical_clock
+        self.logical_clock = max(self.logical_clock, received_timestamp) + 1
+        if self.logical_clock != old_clock:
+            out.write(f"[{self.proc_id}] Relógio ajustado no recebimento: {old_clock} → {self.logical_clock} (timestamp recebido: {received_timestamp})\n")
+        else:
+            out.write(f"[{self.proc_id}] Relógio inalterado no recebimento: {self.logical_clock} (timestamp recebido: {received_timestamp})\n")
     
     def get_clock(self):
         """Obter valor atual do relógio lógico."""
-        with self.clock_lock:
+        with self._state_lock:
             return self.logical_clock
     
-    def start(self):
-        """Iniciar o servidor do processo."""
-        self._running.set()
+    def start(self, server_socket=None):
+        """Iniciar o servidor do processo e retornar a porta em que ele escuta.
+        
+        `server_socket` pode ser um socket de escuta já criado com create_listener();
+        caso contrário a porta do processo é aberta aqui.
+        """
+        if server_socket is None:
+            server_socket = create_listener(self.port)
+        server_socket.setblocking(False)
+        self._server_socket = server_socket
+        self._running = True
+        # Um único worker: as mensagens de cada canal precisam ser processadas na ordem
+        # de chegada (FIFO), e todo o processamento já é serializado por _state_lock
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
         t = threading.Thread(target=self._serve, daemon=True)
         t.start()
+        threading.Thread(target=self._sender_loop, daemon=True).start()
+        threading.Thread(target=self._ack_flusher_loop, daemon=True).start()
+        return self.port
     
     def _serve(self):
-        """Loop principal do servidor para lidar com conexões de entrada."""
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((HOST, self.port))
-        s.listen(5)
-        self._server_socket = s
+        """Loop principal do servidor: um único seletor atende o socket de escuta e todas as conexões."""
+        s = self._server_socket
         print(f"[{self.proc_id}] escutando em {HOST}:{self.port}")
         
+        sel = selectors.DefaultSelector()
         try:
-            while self._running.is_set():
-                s.settimeout(1.0)
+            sel.register(s, selectors.EVENT_READ)
+            sel.register(self._wake_r, selectors.EVENT_READ)
+            while self._running:
                 try:
-                    conn, addr = s.accept()
-                    threading.Thread(target=self._handle_connection, args=(conn,), daemon=True).start()
-                except socket.timeout:
+                    events = sel.select()
+                except OSError as e:
+                    if not self._running:
+                        break
+                    print(f"[{self.proc_id}] Erro no seletor do servidor: {e}")
                     continue
+                for key, _ in events:
+                    if key.fileobj is s:
+                        self._accept_connection(sel, s)
+                    elif key.fileobj is self._wake_r:
+                        # stop() foi chamado; _running já está desligado
+                        break
+                    else:
+                        self._read_connection(sel, key.fileobj, key.data)
+        except (OSError, ValueError) as e:
+            # Esperado apenas quando stop() fechou os sockets antes do registro
+            if self._running:
+                print(f"[{self.proc_id}] Erro no servidor: {e}")
         finally:
-            try:
-                s.close()
-            except Exception:
-                pass
+            for key in list(sel.get_map().values()):
+                try:
+                    key.fileobj.close()
+                except Exception:
+                    pass
+            sel.close()
             print(f"[{self.proc_id}] servidor parado")
     
-    def _handle_connection(self, conn):
-        """Lidar com conexão de entrada e processar mensagem recebida."""
+    def _accept_connection(self, sel, server):
+        """Aceitar uma nova conexão e registrá-la no seletor com seu buffer de leitura."""
         try:
-            data = conn.recv(4096)
-            if data:
-                message_data = json.loads(data.decode())
-                message = Message.from_dict(message_data)
-                self._process_received_message(message)
-        except Exception as e:
+            conn, addr = server.accept()
+        except BlockingIOError:
+            return
+        except OSError as e:
+            # Erros de accept (ex.: ECONNABORTED, EMFILE) não derrubam o servidor;
+            # após stop() o socket de escuta já está fechado e o erro é esperado
+            if self._running:
+                print(f"[{self.proc_id}] Erro ao aceitar conexão: {e}")
+            return
+        conn.setblocking(False)
+        sel.register(conn, selectors.EVENT_READ, data=_RecvBuffer())
+    
+    def _read_connection(self, sel, conn, rbuf):
+        """Ler dados disponíveis de uma conexão e processar todas as mensagens completas.
+        
+        Os dados são lidos com recv_into direto no buffer pré-alocado da conexão e as
+        mensagens são decodificadas a partir de fatias do memoryview, sem cópias.
+        """
+        try:
+            n = conn.recv_into(rbuf.view[rbuf.fill:])
+        except BlockingIOError:
+            return
+        except OSError as e:
             print(f"[{self.proc_id}] Erro ao lidar com conexão: {e}")
-        finally:
+            n = 0
+        if not n:
+            sel.unregister(conn)
             conn.close()
+            rbuf.view.release()
+            return
+        
+        rbuf.fill += n
+        offset = 0
+        needed = 0
+        while rbuf.fill - offset >= FRAME_HEADER.size:
+            (length,) = FRAME_HEADER.unpack_from(rbuf.buf, offset)
+            start = offset + FRAME_HEADER.size
+            end = start + length
+            if rbuf.fill < end:
+                needed = end - offset
+                break
+            try:
+                message = Message.from_bytes(rbuf.view[start:end])
+            except Exception as e:
+                print(f"[{self.proc_id}] Erro ao decodificar mensagem: {e}")
+            else:
+                if not self._dispatch(message):
+                    return
+            offset = end
+        rbuf.compact(offset, needed)
+    
+    def _dispatch(self, message):
+        """Entregar a mensagem ao pool de workers; retorna False se o pool já foi encerrado."""
+        try:
+            self._pool.submit(self._handle_message, message)
+        except RuntimeError:
+            # Pool já encerrado por stop()
+            return False
+        return True
+    
+    def _handle_message(self, message):
+        """Processar uma mensagem recebida (executado no pool de workers)."""
+        try:
+            self._process_received_message(message)
+        except Exception as e:
+            print(f"[{self.proc_id}] Erro ao processar mensagem: {e}")
     
     def _process_received_message(self, message):
         """
         Processar uma mensagem recebida, seja multicast ou confirmação (ack).
         """
         if message.msg_type == MessageType.MULTICAST:
-            #Ao receber, ajustar Cj = max{Cj, ts(m)} + 1
-            self.update_clock_on_receive(message.timestamp)
-            
-            # Adicionar à fila ordenada por timestamp, depois por remetente para quebra de empate
-            with self.queue_lock:
-                self.message_queue.append(message)
-                self.message_queue.sort(key=lambda m: (m.timestamp, m.sender))
-            
-            print(f"[{self.proc_id}] Recebido multicast de {message.sender}: '{message.content}' (ts:{message.timestamp})")
+            # O log é acumulado em `out` e escrito somente depois de liberar o lock
+            out = io.StringIO()
+            out.write(f"[{self.proc_id}] Recebido multicast de {message.sender}: '{message.content}' (ts:{message.timestamp})\n")
             
-            # Inicializar rastreamento de confirmação
-            with self.ack_lock:
-                self.acknowledgments[message.msg_id] = set()
-            
-            # Processar quaisquer confirmações pendentes para esta mensagem
-            # Isso lida com o cenário onde acks chegaram antes da mensagem original
-            with self.pending_lock:
+            with self._state_lock:
+                #Ao receber, ajustar Cj = max{Cj, ts(m)} + 1
+                self._update_clock_on_receive_locked(message.timestamp, out)
+                
+                # Inicializar rastreamento de confirmação, sem apagar acks já registrados
+                # (a mensagem do próprio processo já tem entrada criada em send_message)
+                self.acknowledgments.setdefault(message.msg_id, 0)
+                
+                # Processar quaisquer confirmações pendentes para esta mensagem
+                # Isso lida com o cenário onde acks chegaram antes da mensagem original
                 if message.msg_id in self.pending_acks:
-                    pending_ack_messages = self.pending_acks[message.msg_id]
-                    del self.pending_acks[message.msg_id]
+                    pending_ack_messages = self.pending_acks.pop(message.msg_id)
                     for ack_msg in pending_ack_messages:
-                        self._process_acknowledgment(ack_msg)
+                        self._register_acknowledgment_locked(message.msg_id, ack_msg, out)
+            sys.stdout.write(out.getvalue())
             
-            # Enviar confirmação para todos os outros processos
-            threading.Timer(0.01, self._send_acknowledgment, args=(message,)).start()
+            # Adicionar à fila ordenada por timestamp, depois por remetente para quebra de empate.
+            # A ordenação é feita pela consumidora em _drain_incoming
+            self._incoming.append(message)
             
-        elif message.msg_type == MessageType.ACK:
+            # Enviar confirmação para todos os outros processos; a thread de acks faz o envio
+            # agrupado. Acks que chegam antes da mensagem já são tratados por pending_acks.
+            self._send_acknowledgment(message)
+            
+        elif message.msg_type == MessageType.ACK_BATCH:
             self._process_acknowledgment(message)
     
     def _process_acknowledgment(self, message):
-        """Processar uma mensagem de confirmação."""
-        # Ao receber, ajustar Cj = max{Cj, ts(m)} + 1
-        self.update_clock_on_receive(message.timestamp)
-        
-        
+        """Processar uma mensagem de confirmação agregada (ACK_BATCH)."""
+        out = io.StringIO()
+        with self._state_lock:
+            # Ao receber, ajustar Cj = max{Cj, ts(m)} + 1 (uma vez para o lote inteiro)
+            self._update_clock_on_receive_locked(message.timestamp, out)
+            
+            for msg_id in message.original_msg_ids:
+                self._register_acknowledgment_locked(msg_id, message, out)
+        sys.stdout.write(out.getvalue())
+    
+    def _register_acknowledgment_locked(self, msg_id, ack_message, out):
+        """Registrar a confirmação de `ack_message.sender` para a mensagem `msg_id` (sob _state_lock)."""
         # Verificar se temos a mensagem original
-        with self.ack_lock:
-            if message.original_msg_id in self.acknowledgments:
-                # Temos a mensagem original, registrar a confirmação
-                self.acknowledgments[message.original_msg_id].add(message.sender)
-                print(f"[{self.proc_id}] Recebida confirmação de {message.sender} para mensagem {message.original_msg_id}")
-            else:
-                # Mensagem original ainda não recebida
-                # Armazenamos a confirmação como pendente até que a mensagem original chegue
-                with self.pending_lock:
-                    if message.original_msg_id not in self.pending_acks:
-                        self.pending_acks[message.original_msg_id] = []
-                    self.pending_acks[message.original_msg_id].append(message)
-                    print(f"[{self.proc_id}] Recebida confirmação de {message.sender} para mensagem {message.original_msg_id} (pendente - mensagem original ainda não recebida)")
+        if msg_id in self.acknowledgments:
+            # Temos a mensagem original, registrar a confirmação
+            self.acknowledgments[msg_id] |= self._proc_bit.get(ack_message.sender, 0)
+            out.write(f"[{self.proc_id}] Recebida confirmação de {ack_message.sender} para mensagem {format_msg_id(msg_id)}\n")
+        else:
+            # Mensagem original ainda não recebida
+            # Armazenamos a confirmação como pendente até que a mensagem original chegue
+            self.pending_acks.setdefault(msg_id, []).append(ack_message)
+            out.write(f"[{self.proc_id}] Recebida confirmação de {ack_message.sender} para mensagem {format_msg_id(msg_id)} (pendente - mensagem original ainda não recebida)\n")
     
     def _send_acknowledgment(self, original_message):
-        """Enviar confirmação para uma mensagem recebida."""
-        #  Antes de executar evento (enviar), incrementar Ci
-        current_time = self.increment_clock()
-        
-        # Definir timestamp da mensagem para Ci (após passo 1)
-        ack_message = Message(
-            msg_type=MessageType.ACK,
-            sender=self.proc_id,
-            timestamp=current_time,
-            original_msg_id=original_message.msg_id
-        )
-        
-        print(f"[{self.proc_id}] Enviando confirmação para mensagem de {original_message.sender} (ts:{current_time})")
+        """Enfileirar a confirmação de uma mensagem recebida no próximo lote de acks."""
+        with self._ack_cond:
+            self._pending_ack_batch.append(original_message.msg_id)
+            self._ack_cond.notify()
+    
+    def _ack_flusher_loop(self):
+        """Thread que envia as confirmações acumuladas como uma única mensagem ACK_BATCH.
         
-        # Enviar confirmação para todos os processos no grupo
-        self._broadcast_message(ack_message)
+        O lote é enviado quando atinge ACK_BATCH_SIZE confirmações ou quando
+        nenhuma nova confirmação chega durante ACK_FLUSH_DELAY.
+        """
+        while True:
+            with self._ack_cond:
+                while not self._pending_ack_batch and self._running:
+                    self._ack_cond.wait()
+                if not self._running:
+                    break
+                while len(self._pending_ack_batch) < ACK_BATCH_SIZE:
+                    size = len(self._pending_ack_batch)
+                    self._ack_cond.wait(ACK_FLUSH_DELAY)
+                    if len(self._pending_ack_batch) == size:
+                        break
+                # No máximo ACK_BATCH_SIZE ids por mensagem; o restante fica para o próximo envio
+                batch = self._pending_ack_batch[:ACK_BATCH_SIZE]
+                del self._pending_ack_batch[:ACK_BATCH_SIZE]
+            self._send_ack_batch(batch)
+    
+    def _send_ack_batch(self, msg_ids):
+        """Enviar uma confirmação agregada para várias mensagens recebidas."""
+        out = io.StringIO()
+        with self._state_lock:
+            #  Antes de executar evento (enviar), incrementar Ci
+            current_time = self._increment_clock_locked(out)
+            
+            # Definir timestamp da mensagem para Ci (após passo 1)
+            ack_message = Message(
+                msg_type=MessageType.ACK_BATCH,
+                sender=self.proc_id,
+                timestamp=current_time,
+                original_msg_ids=msg_ids
+            )
+            
+            out.write(f"[{self.proc_id}] Enviando confirmação para {len(msg_ids)} mensagem(ns) (ts:{current_time})\n")
+            
+            # Enviar confirmação para todos os processos no grupo
+            self._broadcast_message(ack_message)
+        sys.stdout.write(out.getvalue())
     
     def try_deliver_message(self):
         """
@@ -193,36 +408,69 @@ class Process:
         - Só pode entregar a mensagem do INÍCIO da fila
         - E somente se foi confirmada por TODOS os processos do grupo
         """
-        with self.queue_lock:
-            if not self.message_queue:
-                print(f"[{self.proc_id}] Nenhuma mensagem na fila para entregar")
-                return False
-            
-            #  Somente verificar o INÍCIO da fila (índice 0)
-            head_message = self.message_queue[0]
-            
-            # Verificar se esta mensagem do INÍCIO foi confirmada por todos os processos
-            with self.ack_lock:
+        # A saída é montada sob o lock e escrita de uma vez depois de liberá-lo
+        buf = io.StringIO()
+        delivered_message = None
+        with self._state_lock:
+            self._drain_incoming()
+            if not self._queue_size:
+                buf.write(f"[{self.proc_id}] Nenhuma mensagem na fila para entregar\n")
+            else:
+                #  Somente verificar o INÍCIO da fila
+                head_message = self._queue_head()[3]
+                
+                # Verificar se esta mensagem do INÍCIO foi confirmada por todos os processos
                 if head_message.msg_id in self.acknowledgments:
-                    acked_by = self.acknowledgments[head_message.msg_id]
-                    acks_received = len(acked_by)
+                    mask = self.acknowledgments[head_message.msg_id]
+                    acks_received = mask.bit_count()
                     
-                    print(f"[{self.proc_id}] Verificando mensagem do INÍCIO '{head_message.content}' de {head_message.sender}")
-                    print(f"[{self.proc_id}] Confirmações: {acks_received}/{self.required_acks}")
-                    print(f"[{self.proc_id}] Confirmado por: {sorted(list(acked_by))}")
+                    buf.write(f"[{self.proc_id}] Verificando mensagem do INÍCIO '{head_message.content}' de {head_message.sender}\n")
+                    buf.write(f"[{self.proc_id}] Confirmações: {acks_received}/{self.required_acks}\n")
+                    buf.write(f"[{self.proc_id}] Confirmado por: {self._acked_by(mask)}\n")
                     
-                    if acks_received >= self.required_acks:
+                    if mask == self._full_mask:
                         # Mensagem do INÍCIO pode ser entregue - remover da fila
-                        delivered_message = self.message_queue.pop(0)
+                        delivered_message = self.message_queue[head_message.sender].popleft()[3]
+                        self._queue_size -= 1
                         del self.acknowledgments[head_message.msg_id]
-                        self._deliver_message(delivered_message)
-                        return True
                     else:
-                        print(f"[{self.proc_id}] Não é possível entregar mensagem do INÍCIO: necessita de mais {self.required_acks - acks_received} confirmações")
-                        return False
+                        buf.write(f"[{self.proc_id}] Não é possível entregar mensagem do INÍCIO: necessita de mais {self.required_acks - acks_received} confirmações\n")
                 else:
-                    print(f"[{self.proc_id}] Não é possível entregar mensagem do INÍCIO: nenhuma confirmação recebida ainda")
-                    return False
+                    buf.write(f"[{self.proc_id}] Não é possível entregar mensagem do INÍCIO: nenhuma confirmação recebida ainda\n")
+        
+        sys.stdout.write(buf.getvalue())
+        if delivered_message is None:
+            return False
+        self._deliver_message(delivered_message)
+        return True
+    
+    def _drain_incoming(self):
+        """Mover as mensagens recebidas da área de espera para a fila ordenada (sob _state_lock)."""
+        while True:
+            try:
+                message = self._incoming.popleft()
+            except IndexError:
+                return
+            self._enqueue(message)
+    
+    def _enqueue(self, message):
+        """Inserir mensagem na deque do seu remetente, mantendo-a ordenada."""
+        entry = (message.timestamp, message.sender, message.msg_id, message)
+        pending = self.message_queue.setdefault(message.sender, deque())
+        if not pending or pending[-1] <= entry:
+            # Caso comum: chegada em ordem de timestamp
+            pending.append(entry)
+        else:
+            bisect.insort(pending, entry)
+        self._queue_size += 1
+    
+    def _queue_head(self):
+        """Entrada do INÍCIO da fila: a menor entre os inícios das deques de cada remetente."""
+        return min(pending[0] for pending in self.message_queue.values() if pending)
+    
+    def _acked_by(self, mask):
+        """Nomes dos processos presentes na máscara de confirmações."""
+        return [name for name, bit in self._proc_bit.items() if mask & bit]
     
     def _deliver_message(self, message):
         """Entregar uma mensagem para a aplicação."""
@@ -231,94 +479,204 @@ class Process:
     
     def send_message(self, content):
         """Enviar uma mensagem usando multicast totalmente ordenado."""
-        # Antes de executar evento (enviar), incrementar Ci
-        current_time = self.increment_clock()
-        
-        # Definir timestamp da mensagem para Ci (após passo 1)
-        message = Message(
-            msg_type=MessageType.MULTICAST,
-            content=content,
-            sender=self.proc_id,
-            timestamp=current_time
-        )
-        
-        print(f"[{self.proc_id}] Enviando multicast: '{content}' (ts:{current_time})")
+        out = io.StringIO()
+        with self._state_lock:
+            # Antes de executar evento (enviar), incrementar Ci
+            current_time = self._increment_clock_locked(out)
+            
+            # Definir timestamp da mensagem para Ci (após passo 1)
+            message = Message(
+                msg_type=MessageType.MULTICAST,
+                content=content,
+                sender=self.proc_id,
+                timestamp=current_time
+            )
+            
+            out.write(f"[{self.proc_id}] Enviando multicast: '{content}' (ts:{current_time})\n")
+            
+            # Inicializar rastreamento de confirmação
+            self.acknowledgments[message.msg_id] = 0
+            
+            # Transmitir para todos os processos 
+            # A mensagem será enfileirada quando a recebermos de volta
+            self._broadcast_message(message)
+        sys.stdout.write(out.getvalue())
+    
+    def _broadcast_message(self, message):
+        """Transmitir uma mensagem para todos os processos no grupo.
         
-        # Inicializar rastreamento de confirmação
-        with self.ack_lock:
-            self.acknowledgments[message.msg_id] = set()
+        A mensagem é apenas enfileirada; a thread de envio faz a transmissão para os
+        outros processos. A entrega para o próprio processo não passa pela rede: vai
+        direto para o pool, na mesma fila das mensagens recebidas.
+        """
+        # A cópia local entra no pool antes do envio: assim ela é sempre processada
+        # antes de qualquer confirmação que os outros processos enviem em resposta
+        if self._pool is not None:
+            self._dispatch(message)
+        self._send_queue.put(message)
+    
+    def _sender_loop(self):
+        """Thread de envio: agrupa as mensagens enfileiradas e envia um lote por par."""
+        while True:
+            # Bloqueia pela primeira mensagem e drena as demais já disponíveis
+            message = self._send_queue.get()
+            if message is None:
+                break
+            batch = [message]
+            while len(batch) < SEND_BATCH_SIZE:
+                try:
+                    message = self._send_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if message is None:
+                    self._send_queue.put(None)
+                    break
+                batch.append(message)
+            
+            buffers = []
+            for message in batch:
+                try:
+                    payload = message.to_bytes()
+                except (struct.error, ValueError) as e:
+                    # Uma mensagem que não cabe no formato do quadro é descartada,
+                    # sem derrubar a thread de envio
+                    print(f"[{self.proc_id}] Erro ao serializar mensagem de {message.sender} (ts:{message.timestamp}): {e}")
+                    continue
+                buffers.append(FRAME_HEADER.pack(len(payload)))
+                buffers.append(payload)
+            if not buffers:
+                continue
+            
+            for port in self._remote_ports:
+                self._send_to_peer(port, buffers)
         
-        # Transmitir para todos os processos 
-        # A mensagem será enfileirada quando a recebermos de volta
-        self._broadcast_message(message)
+        for conn in self._peer_conns.values():
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._peer_conns.clear()
     
-    def _broadcast_message(self, message):
-        """Transmitir uma mensagem para todos os processos no grupo."""
-        message_data = json.dumps(message.to_dict()).encode()
+    def _send_to_peer(self, port, buffers):
+        """Enviar um lote de quadros para um par, usando uma única chamada sendmsg.
         
-        for port in self.all_ports:
+        Se a conexão guardada estiver morta (por exemplo, o par reiniciou), ela é
+        reaberta uma vez e o mesmo lote é reenviado, para que nenhuma mensagem se perca.
+        """
+        for attempt in range(2):
+            conn = self._peer_conns.get(port)
+            reused = conn is not None
             try:
-                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                s.settimeout(2.0)
-                s.connect((HOST, port))
-                s.send(message_data)
-                s.close()
-            except Exception as e:
-                print(f"[{self.proc_id}] Falha ao enviar para porta {port}: {e}")
+                if reused and self._peer_closed(conn):
+                    self._drop_peer(port)
+                    conn = None
+                    reused = False
+                if conn is None:
+                    conn = socket.create_connection((HOST, port), timeout=2.0)
+                    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    self._peer_conns[port] = conn
+                total = sum(len(b) for b in buffers)
+                sent = conn.sendmsg(buffers)
+                if sent < total:
+                    conn.sendall(b"".join(buffers)[sent:])
+                return
+            except OSError as e:
+                self._drop_peer(port)
+                if not reused or attempt:
+                    print(f"[{self.proc_id}] Falha ao enviar para porta {port}: {e}")
+                    return
+    
+    @staticmethod
+    def _peer_closed(conn):
+        """Verificar, sem bloquear, se o par fechou a conexão (nada é enviado de volta nela)."""
+        timeout = conn.gettimeout()
+        conn.setblocking(False)
+        try:
+            return conn.recv(1, socket.MSG_PEEK) == b""
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+        finally:
+            conn.settimeout(timeout)
+    
+    def _drop_peer(self, port):
+        """Fechar e esquecer a conexão persistente com um par."""
+        conn = self._peer_conns.pop(port, None)
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
     
     def show_queue(self):
         """Exibir fila de mensagens atual com regras de multicast totalmente ordenado."""
-        with self.queue_lock:
-            if not self.message_queue:
-                print(f"[{self.proc_id}] Fila de mensagens está vazia")
-            else:
-                print(f"[{self.proc_id}] Fila de mensagens ({len(self.message_queue)} mensagens):")
-                for i, msg in enumerate(self.message_queue):
-                    with self.ack_lock:
-                        acks = len(self.acknowledgments.get(msg.msg_id, set()))
-                        needed = self.required_acks
-                        acked_by = self.acknowledgments.get(msg.msg_id, set())
-                    
-                    # Somente a mensagem do INÍCIO (i == 0) pode ser entregável em multicast totalmente ordenado
-                    is_head = (i == 0)
-                    is_fully_acked = (acks >= needed)
-                    deliverable = " (ENTREGÁVEL)" if is_head and is_fully_acked else ""
-                    head_indicator = " [INÍCIO]" if is_head else ""
-                    blocked_reason = ""
-                    
-                    if not is_head and is_fully_acked:
-                        blocked_reason = " (bloqueada: não está no início)"
-                    elif is_head and not is_fully_acked:
-                        blocked_reason = f" (bloqueada: necessita de mais {needed - acks} confirmações)"
-                    
-                    print(f"  {i+1}. '{msg.content}' de {msg.sender} (ts:{msg.timestamp}) - {acks}/{needed} confirmações{deliverable}{head_indicator}{blocked_reason}")
-                    if acked_by:
-                        print(f"      Confirmado por: {sorted(list(acked_by))}")
+        # Copiar o estado sob o lock; a formatação e a escrita acontecem depois de liberá-lo
+        with self._state_lock:
+            self._drain_incoming()
+            entries = [(msg, self.acknowledgments.get(msg.msg_id, 0))
+                       for _, _, _, msg in heapq.merge(*self.message_queue.values())]
+            pending = [(msg_id, [ack.sender for ack in ack_list])
+                       for msg_id, ack_list in self.pending_acks.items()]
+        
+        buf = io.StringIO()
+        if not entries:
+            buf.write(f"[{self.proc_id}] Fila de mensagens está vazia\n")
+        else:
+            needed = self.required_acks
+            buf.write(f"[{self.proc_id}] Fila de mensagens ({len(entries)} mensagens):\n")
+            for i, (msg, mask) in enumerate(entries):
+                acks = mask.bit_count()
                 
-                # Mostrar confirmações pendentes (acks que chegaram antes das mensagens originais)
-                with self.pending_lock:
-                    if self.pending_acks:
-                        print(f"\n[{self.proc_id}] Confirmações pendentes (recebidas antes da mensagem original):")
-                        for msg_id, ack_list in self.pending_acks.items():
-                            senders = [ack.sender for ack in ack_list]
-                            print(f"  Mensagem {msg_id}: Confirmações de {senders}")
+                # Somente a mensagem do INÍCIO (i == 0) pode ser entregável em multicast totalmente ordenado
+                is_head = (i == 0)
+                is_fully_acked = (mask == self._full_mask)
+                deliverable = " (ENTREGÁVEL)" if is_head and is_fully_acked else ""
+                head_indicator = " [INÍCIO]" if is_head else ""
+                blocked_reason = ""
                 
+                if not is_head and is_fully_acked:
+                    blocked_reason = " (bloqueada: não está no início)"
+                elif is_head and not is_fully_acked:
+                    blocked_reason = f" (bloqueada: necessita de mais {needed - acks} confirmações)"
                 
-                if self.message_queue:
-                    head_msg = self.message_queue[0]
-                    with self.ack_lock:
-                        head_acks = len(self.acknowledgments.get(head_msg.msg_id, set()))
-                    
-                    print(f"\n[{self.proc_id}] Status do Multicast Totalmente Ordenado:")
-                    if head_acks >= self.required_acks:
-                        print(f"  ✓ Mensagem do INÍCIO pode ser entregue")
-                    else:
-                        print(f"  ✗ Mensagem do INÍCIO necessita de mais {self.required_acks - head_acks} confirmações")
-                        print(f"  ✗ Todas as outras mensagens bloqueadas até que a do INÍCIO seja entregue")
+                buf.write(f"  {i+1}. '{msg.content}' de {msg.sender} (ts:{msg.timestamp}) - {acks}/{needed} confirmações{deliverable}{head_indicator}{blocked_reason}\n")
+                if mask:
+                    buf.write(f"      Confirmado por: {self._acked_by(mask)}\n")
+            
+            # Mostrar confirmações pendentes (acks que chegaram antes das mensagens originais)
+            if pending:
+                buf.write(f"\n[{self.proc_id}] Confirmações pendentes (recebidas antes da mensagem original):\n")
+                for msg_id, senders in pending:
+                    buf.write(f"  Mensagem {format_msg_id(msg_id)}: Confirmações de {senders}\n")
+            
+            head_mask = entries[0][1]
+            head_acks = head_mask.bit_count()
+            
+            buf.write(f"\n[{self.proc_id}] Status do Multicast Totalmente Ordenado:\n")
+            if head_mask == self._full_mask:
+                buf.write(f"  ✓ Mensagem do INÍCIO pode ser entregue\n")
+            else:
+                buf.write(f"  ✗ Mensagem do INÍCIO necessita de mais {needed - head_acks} confirmações\n")
+                buf.write(f"  ✗ Todas as outras mensagens bloqueadas até que a do INÍCIO seja entregue\n")
+        
+        sys.stdout.write(buf.getvalue())
     
     def stop(self):
-        """Parar o processo."""
-        self._running.clear()
+        """Parar o processo. Chamadas repetidas não têm efeito."""
+        if not self._running:
+            return
+        self._running = False
+        try:
+            self._wake_w.send(b"\0")
+            self._wake_w.close()
+        except OSError:
+            pass
+        self._send_queue.put(None)
+        with self._ack_cond:
+            self._ack_cond.notify()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
         try:
             if self._server_socket:
                 self._server_socket.close()